@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the rainfall, movie and linear regression analyses.
+
+Each benchmark runs against synthetic data at several scales, with plotting
+stubbed out, so the suite runs offline in a few minutes. Results are written
+as a JSON report and compared against the stored baseline.json; any benchmark
+slower than the baseline by more than the tolerance fails the run.
+
+Timings are normalised by a fixed calibration workload, so a baseline
+recorded on one machine can be compared on another of different speed. Fast
+benchmarks are called in a loop until each sample takes MIN_SAMPLE_SECONDS,
+so even sub-millisecond ones are timed precisely enough to compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py                     compare to baseline
+    python benchmarks/run_benchmarks.py --update-baseline   record a new baseline
+    python benchmarks/run_benchmarks.py --scales small --report out.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+for script_dir in ("cso", "imdb", "linear_regression"):
+    sys.path.insert(0, os.path.join(REPO_DIR, script_dir))
+
+# no chart should ever block or open a window during a benchmark
+plt.show = lambda *args, **kwargs: None
+
+import cso_rainfall
+import meta_vis
+import lr_gd_vis
+
+# rows of synthetic data generated for each scale
+SCALES = {"small": 1000, "medium": 20000, "large": 200000}
+
+# the shortest a timing sample may be, fast benchmarks are looped to reach it
+MIN_SAMPLE_SECONDS = 0.05
+
+# the columns of movie_metadata.csv, in file order
+MOVIE_COLUMNS = ["color", "director_name", "num_critic_for_reviews", "duration",
+                 "director_facebook_likes", "actor_3_facebook_likes", "actor_2_name",
+                 "actor_1_facebook_likes", "gross", "genres", "actor_1_name",
+                 "movie_title", "num_voted_users", "cast_total_facebook_likes",
+                 "actor_3_name", "facenumber_in_poster", "plot_keywords",
+                 "movie_imdb_link", "num_user_for_reviews", "language", "country",
+                 "content_rating", "budget", "title_year", "actor_2_facebook_likes",
+                 "imdb_score", "aspect_ratio", "movie_facebook_likes"]
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Drama",
+          "Fantasy", "Horror", "Romance", "Sci-Fi", "Thriller", "Western"]
+
+
+def synthetic_rainfall(data_dir, rows, rng):
+    """
+    Write a Year Month Total Most Days rainfall file for every county
+    """
+    for county in cso_rainfall.get_counties_dict().values():
+        years = 1900 + np.arange(rows) // 12
+        months = np.arange(rows) % 12 + 1
+        total = rng.gamma(4.0, 20.0, rows)
+        most = total * rng.uniform(0.1, 0.4, rows)
+        days = rng.integers(5, 28, rows)
+        np.savetxt(os.path.join(data_dir, county + "Rainfall.txt"),
+                   np.column_stack([years, months, total, most, days]),
+                   fmt=["%d", "%02d", "%.1f", "%.1f", "%d"], delimiter=" ")
+
+
+def synthetic_movies(rows, rng):
+    """
+    Build a DataFrame shaped like movie_metadata.csv, including ~1% duplicate
+    rows, missing values and the trailing non-ASCII characters on titles
+    """
+    people = np.array([f"Person {i}" for i in range(max(rows // 4, 10))], dtype=object)
+    genres = np.array(["|".join(rng.choice(GENRES, size=rng.integers(1, 4), replace=False))
+                       for _ in range(200)], dtype=object)
+
+    def pick(values):
+        return values[rng.integers(0, len(values), rows)]
+
+    def with_missing(values, fraction=0.02):
+        values = pd.Series(values)
+        return values.mask(rng.random(rows) < fraction)
+
+    df = pd.DataFrame({
+        "color": pick(np.array(["Color", " Black and White"], dtype=object)),
+        "director_name": with_missing(pick(people)),
+        "num_critic_for_reviews": with_missing(rng.integers(1, 800, rows).astype(float)),
+        "duration": rng.integers(60, 200, rows).astype(float),
+        "director_facebook_likes": rng.integers(0, 20000, rows).astype(float),
+        "actor_3_facebook_likes": rng.integers(0, 20000, rows).astype(float),
+        "actor_2_name": with_missing(pick(people)),
+        "actor_1_facebook_likes": rng.integers(0, 600000, rows).astype(float),
+        "gross": with_missing(rng.integers(100, 800000000, rows).astype(float), 0.15),
+        "genres": pick(genres),
+        "actor_1_name": with_missing(pick(people)),
+        "movie_title": [f"Movie {i}\u00a0" for i in range(rows)],
+        "num_voted_users": rng.integers(1, 1500000, rows),
+        "cast_total_facebook_likes": rng.integers(0, 600000, rows),
+        "actor_3_name": with_missing(pick(people)),
+        "facenumber_in_poster": rng.integers(0, 10, rows).astype(float),
+        "plot_keywords": pick(np.array(["a|b|c|d|e", "love|war|future|past|friendship"],
+                                       dtype=object)),
+        "movie_imdb_link": [f"http://www.imdb.com/title/tt{i:07d}/?ref_=fn_tt_tt_1"
+                            for i in range(rows)],
+        "num_user_for_reviews": rng.integers(1, 5000, rows).astype(float),
+        "language": pick(np.array(["English", "French", "Spanish", "Hindi"], dtype=object)),
+        "country": pick(np.array(["USA", "UK", "France", "India", "Canada"], dtype=object)),
+        "content_rating": pick(np.array(["PG-13", "PG", "R", "G"], dtype=object)),
+        "budget": rng.integers(10000, 300000000, rows).astype(float),
+        "title_year": with_missing(rng.integers(1920, 2017, rows).astype(float)),
+        "actor_2_facebook_likes": rng.integers(0, 140000, rows).astype(float),
+        "imdb_score": np.round(rng.uniform(1.5, 9.5, rows), 1),
+        "aspect_ratio": pick(np.array([1.85, 2.35, 1.78])),
+        "movie_facebook_likes": rng.integers(0, 350000, rows),
+    }, columns=MOVIE_COLUMNS)
+
+    duplicates = df.sample(n=max(rows // 100, 1), random_state=0)
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def time_calls(func, number):
+    """
+    Return the total wall time, in seconds, of number calls to func
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def best_of(func, repeat):
+    """
+    Return the fastest wall time, in seconds, of a call to func over repeat
+    samples. Each sample loops over enough calls to last MIN_SAMPLE_SECONDS
+    """
+    number = 1
+    elapsed = time_calls(func, number)
+    while elapsed < MIN_SAMPLE_SECONDS:
+        number = max(number * 2, int(number * MIN_SAMPLE_SECONDS / max(elapsed, 1e-9)))
+        elapsed = time_calls(func, number)
+
+    timings = [elapsed] + [time_calls(func, number) for _ in range(repeat - 1)]
+    return min(timings) / number
+
+
+def calibrate():
+    """
+    Time a fixed mix of Python and NumPy work, used to normalise timings so
+    that results from different machines are comparable
+    """
+    values = np.random.default_rng(0).random(200000)
+
+    def workload():
+        sum(i * i for i in range(200000))
+        np.sort(values)
+        pd.Series(values).groupby((values * 100).astype(int)).sum()
+
+    return best_of(workload, 5)
+
+
+def rainfall_benchmarks(rows, rng, repeat, memory):
+    """
+    Load the county files and compute the rainfall statistics
+    """
+    results = {}
+    real_data_dir = cso_rainfall.DATA_DIR
+    with tempfile.TemporaryDirectory() as data_dir:
+        synthetic_rainfall(data_dir, rows, rng)
+        cso_rainfall.DATA_DIR = data_dir
+
+        def load():
+            cso_rainfall.global_counties_data_dict = None
+            cso_rainfall.load_rainfall_txt_files()
+
+        try:
+            results["rainfall.load"] = best_of(load, repeat)
+            results["rainfall.basic_stats"] = best_of(
+                lambda: [cso_rainfall.basic_stats(county, 2)
+                         for county in cso_rainfall.get_counties_dict().values()], repeat)
+            results["rainfall.wettest_location"] = best_of(cso_rainfall.wettest_location,
+                                                           repeat)
+            results["rainfall.prob_rain_days"] = best_of(
+                lambda: cso_rainfall.prob_rain_days(15), repeat)
+        finally:
+            cso_rainfall.global_counties_data_dict = None
+            cso_rainfall.DATA_DIR = real_data_dir
+    return results
+
+
+def movie_benchmarks(rows, rng, repeat, memory):
+    """
+    Load and clean the movie data, then run each of the meta_vis aggregations.
+    The memory saved by the compact load is added to the memory dict
+    """
+    results = {}
+    df_raw = synthetic_movies(rows, rng)
+    with tempfile.TemporaryDirectory() as data_dir:
+        csv_file = os.path.join(data_dir, "movie_metadata.csv")
+        df_raw.to_csv(csv_file, index=False, encoding="utf-8")
+        results["movies.load"] = best_of(lambda: meta_vis.load_movies(csv_file), repeat)
+        memory.update(meta_vis.memory_savings(csv_file))
+        df_raw = meta_vis.read_movies(csv_file)
+
+    results["movies.clean_data"] = best_of(lambda: meta_vis.clean_data(df_raw), repeat)
+    df = meta_vis.clean_data(df_raw)
+    min_yr, max_yr = meta_vis.year_range(df)
+
+    results["movies.top_directors"] = best_of(lambda: meta_vis.top_directors(df, 20), repeat)
+    results["movies.top_actors"] = best_of(lambda: meta_vis.top_actors(df, 20), repeat)
+    results["movies.gross_by_year"] = best_of(
+        lambda: meta_vis.gross_by_year(df, min_yr, max_yr), repeat)
+    results["movies.list_genres"] = best_of(lambda: meta_vis.list_genres(df), repeat)
+    results["movies.genre_mean_score"] = best_of(
+        lambda: meta_vis.genre_mean_score(df, "Drama"), repeat)
+    results["movies.numeric_correlations"] = best_of(
+        lambda: meta_vis.numeric_correlations(df), repeat)
+    results["movies.collaboration_index"] = best_of(
+        lambda: meta_vis.collaboration_index(df), repeat)
+
+    index = meta_vis.collaboration_index(df)
+    name = df["director_name"].iloc[0]
+    results["movies.collaboration_queries"] = best_of(
+        lambda: (meta_vis.top_collaborators(index, name, 10, by="gross"),
+                 meta_vis.within_two_hops(index, name)), repeat)
+    return results
+
+
+def regression_benchmarks(rows, rng, repeat, memory):
+    """
+    Standardise and train the gradient descent model for 500 iterations
+    """
+    X = rng.uniform(0, 100, rows)
+    y = 3.0 * X + 7.0 + rng.normal(0, 5, rows)
+    X_std = lr_gd_vis.standardise(X)
+    return {
+        "regression.standardise": best_of(lambda: lr_gd_vis.standardise(X), repeat),
+        "regression.train": best_of(lambda: lr_gd_vis.linear_regression_gd(X_std, y, 500), repeat),
+    }
+
+
+def run(scales, repeat):
+    """
+    Run every benchmark at each scale, returning the report dict
+    """
+    calibration = calibrate()
+    results = {}
+    memory = {}
+    for scale in scales:
+        rows = SCALES[scale]
+        memory[scale] = {}
+        for suite in (rainfall_benchmarks, movie_benchmarks, regression_benchmarks):
+            rng = np.random.default_rng(0)
+            for name, seconds in suite(rows, rng, repeat, memory[scale]).items():
+                results[f"{name}@{scale}"] = {"seconds": round(seconds, 9),
+                                              "normalised": round(seconds / calibration, 6)}
+                print(f"{name + '@' + scale:<42} {seconds:>12.6f}s", flush=True)
+
+    return {"machine": {"python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "numpy": np.__version__,
+                        "pandas": pd.__version__},
+            "calibration_seconds": round(calibration, 6),
+            "memory": memory,
+            "results": results}
+
+
+def compare(report, baseline, tolerance):
+    """
+    Return a list of messages for each benchmark slower than its baseline by
+    more than the tolerance (0.5 is one and a half times as slow)
+    """
+    regressions = []
+    for name, result in sorted(report["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        expected = baseline["results"][name]["normalised"]
+        ratio = result["normalised"] / expected if expected else 1.0
+        if ratio > 1.0 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x the baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before failing, 0.5 is 1.5 times as slow")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = run(args.scales, args.repeat)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --update-baseline")
+        return 1
+
+    with open(args.baseline) as baseline_file:
+        regressions = compare(report, json.load(baseline_file), args.tolerance)
+    if regressions:
+        print("\nPERFORMANCE REGRESSIONS:")
+        print("\n".join(regressions))
+        return 1
+
+    print("\nNo performance regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,61 @@
 #!/usr/bin/env python3
+import ast
+import csv
+import io
+import math
+import sys
+import timeit
+import warnings
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from profiling import profile_stage, enable_from_argv
+
+
+"""
+Maps each operator symbol accepted in batch mode to its vectorised NumPy ufunc
+"""
+BATCH_OPERATORS = {"+": np.add,
+                   "-": np.subtract,
+                   "*": np.multiply,
+                   "/": np.true_divide}
+
+
+"""
+The columns of a batch input, and the int64 range integer operands are kept in
+"""
+BATCH_COLUMNS = ["a", "op", "b"]
+INT64_MIN = int(np.iinfo(np.int64).min)
+INT64_MAX = int(np.iinfo(np.int64).max)
+
+
+"""
+The per-row errors a batch can report, by error code ("" for no error)
+"""
+BATCH_ERRORS = ["", "blank line", "malformed row", "invalid number", "non-finite number",
+                "integer out of range", "unknown operator", "division by zero",
+                "integer overflow", "result out of range"]
+BATCH_ERROR_CODES = {error: code for code, error in enumerate(BATCH_ERRORS)}
+
+
+"""
+The AST node types an arithmetic expression may be built from. Anything else
+(calls, attributes, subscripts, comparisons...) is rejected before compiling
+"""
+EXPRESSION_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant,
+                    ast.Name, ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div,
+                    ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+
+
+"""
+The largest result, in bits, an integer power may give. Python integers never
+overflow, so without a limit "9 ** 9 ** 9" would run for hours
+"""
+MAX_POWER_BITS = 4096
+
 
 """
 Safely Retrieves an number from a user firendly input
@@ -34,41 +91,552 @@ def ask_ok(prompt, retries=100, reminder='Please try again!'):
         print(reminder)
 
 
+"""
+Maps each calculator menu option to its name and operation
+"""
+OPERATIONS = {"1": ("Addition", lambda x, y: x + y),
+              "2": ("Subtraction", lambda x, y: x - y),
+              "3": ("Multiplication", lambda x, y: x * y),
+              "4": ("Division", lambda x, y: x / y)}
+
+
+"""
+Performs the basic calculator operation for the menu option on two numbers
+"""
+def calculate(num_1, num_2, operation_k):
+    if operation_k not in OPERATIONS:
+        raise ValueError(f"unknown operation '{operation_k}'")
+    return OPERATIONS[operation_k][1](num_1, num_2)
+
+
 """
 Allows the user to do some basic calculator operations on two given numbers
 """
 def calculator():
-    operation_dict = {"1": "Addition", 
-                      "2": "Subtraction", 
-                      "3": "Multiplication", 
-                      "4": "Division"}
-    
     num_1 = ask_for_int("Please enter a numerical value: ")
     num_2 = ask_for_int("Please enter a numerical value: ")
             
     print("Would you like to perform: ")    
-    for k, v in operation_dict.items():
-        print(k, " : " ,v)
+    for k, v in OPERATIONS.items():
+        print(k, " : " ,v[0])
         
     operation_k = input("> ") 
-    operation_v = operation_dict[operation_k]
+    operation_v = OPERATIONS[operation_k][0]
     
-    result = {
-        "1" : lambda x, y: x + y,            
-        "2" : lambda x, y: x - y,            
-        "3" : lambda x, y: x * y,            
-        "4" : lambda x, y: x / y,            
-    }[operation_k](num_1, num_2)  
+    result = calculate(num_1, num_2, operation_k)
     
     print(operation_v, " of ", num_1, " and ", num_2, " is ", result) 
     
     
 """
-Allow the user to re-use the calculator as often they wish
-"""    
-use_calc = True    
-while use_calc:
-    calculator()
-    use_calc = ask_ok("Would you like to perform another operation y\\n? ")
+Splits a single batch line into its (a, op, b) parts. Lines are either
+whitespace separated ("12 / 4") or comma separated ("12,/,4")
+"""
+def parse_operation(line):
+    parts = line.split(",") if "," in line else line.split()
+    if len(parts) != 3:
+        return None
+    return tuple(part.strip() for part in parts)
+
+
+"""
+Splits a single batch line into its a, op and b fields and the text of any
+further fields, padding a short line with empty fields
+"""
+def split_fields(line):
+    parts = [part.strip() for part in (line.split(",") if "," in line else line.split())]
+    parts += [""] * (3 - len(parts))
+    return tuple(parts[:3]) + (",".join(parts[3:]),)
+
+
+"""
+Parses a chunk of batch lines column-wise with the pandas C parser, splitting
+the fields on sep, giving one row per line, blank lines included. dtype is
+applied to the a, op and b columns
+"""
+def read_fields(chunk, sep, dtype):
+    columns = BATCH_COLUMNS + ["extra"]
+    try:
+        with warnings.catch_warnings():
+            # an over-long first row lands in "extra", and is reported as malformed
+            warnings.simplefilter("ignore", pd.errors.ParserWarning)
+            return pd.read_csv(io.StringIO("".join(chunk)), sep=sep, header=None,
+                               names=columns, index_col=False, dtype=dtype,
+                               keep_default_na=False, quoting=csv.QUOTE_NONE,
+                               skipinitialspace=True, skip_blank_lines=False)
+    except pd.errors.ParserError:
+        return pd.DataFrame([split_fields(line) for line in chunk],
+                            columns=columns, dtype=object)
+
+
+"""
+Parses a chunk of batch lines into a DataFrame of a, op and b, one row per
+line, and an array of the error code of each row. When both operand columns are
+whole integers they come back as int64, otherwise (or straight away with
+text=True) every field is kept as its text, so that decimals and bad values can
+be parsed exactly. Blank lines, and rows with too few or too many fields, are
+flagged in the error codes but keep the fields as read, so every output row can
+be matched back to its input line
+"""
+def read_batch(chunk, sep, text=False):
+    codes = np.zeros(len(chunk), dtype=np.int8)
+    if not text:
+        frame = read_fields(chunk, sep, {"op": object, "extra": object})
+        malformed = (frame["op"].to_numpy() == "") | (frame["extra"].to_numpy() != "")
+        if frame["a"].dtype == np.int64 and frame["b"].dtype == np.int64 \
+                and not malformed.any():
+            return frame[BATCH_COLUMNS], codes
+
+    frame = read_fields(chunk, sep, object)
+    fields = [frame[column].to_numpy() == "" for column in BATCH_COLUMNS]
+    extra = frame["extra"].to_numpy() != ""
+    flag_errors(codes, np.logical_and.reduce(fields) & ~extra, "blank line")
+    flag_errors(codes, np.logical_or.reduce(fields) | extra, "malformed row")
+    # a line of empty fields such as ",," is not blank
+    for i in np.flatnonzero(codes == BATCH_ERROR_CODES["blank line"]):
+        if chunk[i].strip():
+            codes[i] = BATCH_ERROR_CODES["malformed row"]
+    return frame[BATCH_COLUMNS], codes
+
+
+"""
+Records the error as the error code of each row in mask that has no error yet
+"""
+def flag_errors(codes, mask, error):
+    codes[mask & (codes == 0)] = BATCH_ERROR_CODES[error]
+
+
+"""
+Parses a single operand, giving NaN for an invalid number
+"""
+def parse_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+"""
+Parses a column of operands, either int64 already or text, flagging bad
+values in codes. Integers are kept exactly as int64, anything else is parsed as
+float64. Returns the int values, the float values (integers included) and the
+mask of integer rows
+"""
+def parse_operands(column, codes):
+    if column.dtype == np.int64:
+        return column, column.astype(float), np.ones(len(column), dtype=bool)
+
+    column = column.astype(object)
+    blank = column == ""
+    if blank.any():
+        flag_errors(codes, blank, "malformed row")
+        column = np.where(blank, "0", column)
+    try:
+        ints = column.astype(np.int64)
+        return ints, ints.astype(float), np.ones(len(column), dtype=bool)
+    except (ValueError, OverflowError):
+        pass
+
+    # there are decimals, or bad values, in the column
+    try:
+        floats = column.astype(float)
+    except ValueError:
+        floats = np.array([parse_float(text) for text in column])
+    invalid = np.isnan(floats)
+    for i in np.flatnonzero(invalid):
+        invalid[i] = column[i].strip().lstrip("+-").lower() != "nan"
+    flag_errors(codes, invalid, "invalid number")
+    flag_errors(codes, ~np.isfinite(floats), "non-finite number")
+
+    # any integers among the decimals are still kept exact
+    ints = np.zeros(len(column), dtype=np.int64)
+    integral = np.zeros(len(column), dtype=bool)
+    out_of_range = np.zeros(len(column), dtype=bool)
+    for i in np.flatnonzero(np.isfinite(floats) & (floats == np.floor(floats))):
+        try:
+            value = int(column[i])
+        except ValueError:
+            continue
+        if INT64_MIN <= value <= INT64_MAX:
+            ints[i] = value
+            integral[i] = True
+        else:
+            out_of_range[i] = True
+    flag_errors(codes, out_of_range, "integer out of range")
+
+    floats[integral] = ints[integral]
+    return ints, floats, integral
+
+
+"""
+Divides int64 operands that do not divide exactly, correctly rounded like
+Python's int / int. Operands within +-2**53 are exact as float64, so a single
+float64 division rounds correctly, larger ones are divided as Python ints
+"""
+def true_divide(num_1, num_2):
+    small = (np.abs(num_1) <= 2 ** 53) & (np.abs(num_2) <= 2 ** 53) \
+        & (num_1 != INT64_MIN) & (num_2 != INT64_MIN)
+    results = np.empty(len(num_1), dtype=object)
+    results[small] = num_1[small].astype(float) / num_2[small].astype(float)
+    for i in np.flatnonzero(~small):
+        results[i] = int(num_1[i]) / int(num_2[i])
+    return results
+
+
+"""
+Applies the batch operator op to int64 operands exactly. Returns an object
+array of the results, ints or a correctly rounded float for a division with a
+remainder, and the mask of rows whose result overflows an int64
+"""
+def exact_arithmetic(op, num_1, num_2):
+    if op == "/":
+        quotient, remainder = np.divmod(num_1, num_2)
+        results = quotient.astype(object)
+        inexact = remainder != 0
+        results[inexact] = true_divide(num_1[inexact], num_2[inexact])
+        return results, (num_1 == INT64_MIN) & (num_2 == -1)
+
+    results = BATCH_OPERATORS[op](num_1, num_2)
+    if op == "+":
+        overflow = ((num_1 ^ results) & (num_2 ^ results)) < 0
+    elif op == "-":
+        overflow = ((num_1 ^ num_2) & (num_1 ^ results)) < 0
+    else:
+        overflow = (num_1 != 0) & (results // np.where(num_1 == 0, 1, num_1) != num_2)
+        overflow |= (num_1 == -1) & (num_2 == INT64_MIN)
+    return results.astype(object), overflow
+
+
+"""
+Evaluates columns of (a, op, b) rows, one vectorised NumPy call per operator
+group. The operand columns are int64 or text, and codes optionally gives the
+error code already found for each row by read_batch. Rows with two integer
+operands are evaluated exactly in int64, any other row in float64. Returns an
+object array of the results ("" for a bad row) and of the per-row error
+messages ("" when the row evaluated cleanly), so a bad row never stops the batch
+"""
+def evaluate_batch(a, ops, b, codes=None):
+    ops = np.asarray(ops, dtype=object)
+    codes = np.zeros(len(ops), dtype=np.int8) if codes is None else codes.copy()
+    flag_errors(codes, ops == "", "malformed row")
+    int_1, float_1, integral_1 = parse_operands(np.asarray(a), codes)
+    int_2, float_2, integral_2 = parse_operands(np.asarray(b), codes)
+
+    op_masks = {op: ops == op for op in BATCH_OPERATORS}
+    flag_errors(codes, ~np.logical_or.reduce(list(op_masks.values())), "unknown operator")
+
+    results = np.full(len(ops), "", dtype=object)
+    with np.errstate(all="ignore"):
+        for op, ufunc in BATCH_OPERATORS.items():
+            mask = op_masks[op] & (codes == 0)
+            if op == "/":
+                flag_errors(codes, mask & (float_2 == 0), "division by zero")
+                mask &= float_2 != 0
+
+            exact = mask & integral_1 & integral_2
+            values, overflow = exact_arithmetic(op, int_1[exact], int_2[exact])
+            rows = np.flatnonzero(exact)
+            results[rows[~overflow]] = values[~overflow]
+            codes[rows[overflow]] = BATCH_ERROR_CODES["integer overflow"]
+
+            inexact = mask & ~exact
+            values = ufunc(float_1[inexact], float_2[inexact])
+            finite = np.isfinite(values)
+            rows = np.flatnonzero(inexact)
+            results[rows[finite]] = values[finite]
+            codes[rows[~finite]] = BATCH_ERROR_CODES["result out of range"]
+
+    errors = np.array(BATCH_ERRORS, dtype=object)[codes]
+    for i in np.flatnonzero(codes == BATCH_ERROR_CODES["unknown operator"]):
+        errors[i] = f"unknown operator '{ops[i]}'"
+    return results, errors
+
+
+"""
+Quotes a CSV field that holds a comma or a quote
+"""
+def csv_field(value):
+    value = str(value)
+    if "," in value or '"' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+"""
+Formats the batch columns as CSV rows with a single %-format over every value,
+rather than formatting row by row. Only a row with an error can hold a comma or
+a quote, so only those rows are checked for quoting
+"""
+def format_batch(a, ops, b, results, errors):
+    fields = [np.asarray(column).tolist() for column in (a, ops, b, results, errors)]
+    for i in np.flatnonzero(np.asarray(errors) != ""):
+        for field in fields:
+            field[i] = csv_field(field[i])
+
+    values = [None] * (len(fields) * len(errors))
+    for j, field in enumerate(fields):
+        values[j::len(fields)] = field
+    return ("%s,%s,%s,%s,%s\n" * len(errors)) % tuple(values)
+
+
+"""
+Reads operations from a text stream and writes one CSV result row per input
+line, blank lines included, so the nth row after the header always answers the
+nth line of input (not counting an input header). The first non-blank line
+decides whether the input is comma or whitespace separated. Only chunk_size
+lines are held in memory at a time, so arbitrarily large inputs stream through
+with bounded memory
+"""
+@profile_stage("calculator", "batch")
+def batch_calculator(in_stream, out_stream, chunk_size=100000):
+    out_stream.write("a,op,b,result,error\n")
+    sep = None
+    text = False
+    while True:
+        chunk = list(islice(in_stream, chunk_size))
+        if not chunk:
+            break
+
+        if sep is None:
+            first = next((i for i, line in enumerate(chunk) if line.strip()), None)
+            if first is None:
+                out_stream.write(",,,,blank line\n" * len(chunk))
+                continue
+            sep = "," if "," in chunk[first] else r"\s+"
+            # skip a columnar CSV header such as "a,op,b"
+            if parse_operation(chunk[first]) == tuple(BATCH_COLUMNS):
+                del chunk[first]
+
+        frame, codes = read_batch(chunk, sep, text)
+        if len(frame):
+            # once a chunk needs parsing from text, the later ones most likely do too
+            text = frame["a"].dtype == object
+        a, ops, b = (frame[column].to_numpy() for column in BATCH_COLUMNS)
+        results, errors = evaluate_batch(a, ops, b, codes)
+        # the fields of a malformed line may not hold all of it, so quote it whole
+        for i in np.flatnonzero(errors == "malformed row"):
+            errors[i] = f"malformed row '{chunk[i].strip()}'"
+        out_stream.write(format_batch(a, ops, b, results, errors))
+
+
+"""
+Raises base to exponent, rejecting an integer power whose result would be
+larger than MAX_POWER_BITS
+"""
+def safe_power(base, exponent):
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 \
+            and abs(base) > 1 and exponent * math.log2(abs(base)) > MAX_POWER_BITS:
+        raise ValueError("integer power too large")
+    return base ** exponent
+
+
+"""
+Rewrites every a ** b of an expression as a call to safe_power
+"""
+class PowerTransformer(ast.NodeTransformer):
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Pow):
+            return node
+        call = ast.Call(func=ast.Name(id="_power", ctx=ast.Load()),
+                        args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+"""
+Rewrites every constant of an expression as a NumPy float64, so arithmetic
+between constants alone gives inf/nan like the array arithmetic around it
+"""
+class FloatTransformer(ast.NodeTransformer):
+    def visit_Constant(self, node):
+        call = ast.Call(func=ast.Name(id="_float", ctx=ast.Load()),
+                        args=[ast.Constant(float(node.value))], keywords=[])
+        return ast.copy_location(call, node)
+
+
+"""
+Parses and validates an arithmetic expression such as "(a + b) * 1.5 ** c",
+returning its compiled code and the sorted variable names it uses. With
+vectorised=True the constants are compiled as NumPy float64s. Results are LRU
+cached by expression text, so re-evaluating a formula skips parsing
+"""
+@lru_cache(maxsize=256)
+def compile_expression(text, vectorised=False):
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except (SyntaxError, ValueError):
+        raise ValueError(f"invalid expression '{text}'")
+
+    for node in ast.walk(tree):
+        if not isinstance(node, EXPRESSION_NODES):
+            raise ValueError(f"unsupported syntax in expression '{text}'")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool)
+                                               or not isinstance(node.value, (int, float))):
+            raise ValueError(f"unsupported constant in expression '{text}'")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ValueError(f"unsupported name '{node.id}' in expression '{text}'")
+
+    names = tuple(sorted({node.id for node in ast.walk(tree)
+                          if isinstance(node, ast.Name)}))
+    tree = PowerTransformer().visit(tree)
+    if vectorised:
+        try:
+            tree = FloatTransformer().visit(tree)
+        except OverflowError:
+            raise ValueError(f"number out of range in expression '{text}'")
+    return compile(ast.fix_missing_locations(tree), "<expression>", "eval"), names
+
+
+"""
+Returns the bindings of the names an expression uses, raising ValueError for
+any name without a value
+"""
+def expression_bindings(names, variables):
+    variables = variables or {}
+    missing = [name for name in names if name not in variables]
+    if missing:
+        raise ValueError(f"no value given for {', '.join(missing)}")
+    return {name: variables[name] for name in names}
+
+
+"""
+Evaluates an expression against a dict of variable bindings. The bindings may
+be scalars, or NumPy arrays in which case the whole array of bindings is
+evaluated in a single vectorised pass. A division by zero or an out of range
+scalar result raises ValueError, with the batch mode's error message
+"""
+def evaluate_expression(text, variables=None):
+    code, names = compile_expression(text)
+    try:
+        result = eval(code, {"__builtins__": {}, "_power": safe_power},
+                      expression_bindings(names, variables))
+    except ZeroDivisionError:
+        raise ValueError("division by zero")
+    except OverflowError:
+        raise ValueError("result out of range")
+    if isinstance(result, float) and not math.isfinite(result):
+        raise ValueError("result out of range")
+    return result
+
+
+"""
+Evaluates an expression once over columns of bindings, e.g.
+{"a": [1, 2, 3], "b": [4, 5, 6]}, returning an array of one result per row.
+Constants are float64s too, so division by zero or overflow anywhere in the
+expression, constant parts included, yields inf/nan instead of raising, and an
+expression of constants alone gives its value on every row
+"""
+def evaluate_expression_array(text, columns):
+    code, names = compile_expression(text, vectorised=True)
+    arrays = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+    rows = len(next(iter(arrays.values()), ()))
+    with np.errstate(all="ignore"):
+        result = eval(code, {"__builtins__": {}, "_power": safe_power, "_float": np.float64},
+                      expression_bindings(names, arrays))
+    return np.full(rows, result) if np.ndim(result) == 0 else result
+
+
+"""
+Compares re-parsing an expression for every set of bindings against the cached
+compiled form and the vectorised array path, printing the time for each
+"""
+def benchmark_expressions(text="(a + b) * c / 2 - a ** 2", rows=100000):
+    rng = np.random.default_rng(0)
+    columns = {name: rng.random(rows) + 1 for name in compile_expression(text)[1]}
+    bindings = [{name: float(values[i]) for name, values in columns.items()}
+                for i in range(rows)]
+
+    def naive():
+        for variables in bindings:
+            compile_expression.__wrapped__(text)
+            evaluate_expression(text, variables)
+
+    def cached():
+        for variables in bindings:
+            evaluate_expression(text, variables)
+
+    def vectorised():
+        evaluate_expression_array(text, columns)
+
+    print(f"Evaluating '{text}' over {rows} bindings:")
+    for label, func in (("re-parsing", naive), ("cached", cached),
+                        ("vectorised", vectorised)):
+        print(f"{label:>12} : {min(timeit.repeat(func, number=1, repeat=3)):.4f}s")
+
+
+"""
+Checks that batch division of random integers of mixed sign and magnitude,
+up to the int64 limits, gives exactly Python's int / int (or // when exact).
+Prints each mismatch and returns the number of them
+"""
+def check_batch_division(rows=100000):
+    rng = np.random.default_rng(0)
+    bits = rng.choice([8, 31, 53, 54, 62, 63], size=(2, rows))
+    num_1, num_2 = (rng.integers(-2 ** 62, 2 ** 62, size=(2, rows)) >> (63 - bits)) * 2 \
+        + rng.integers(0, 2, size=(2, rows))
+    num_2[num_2 == 0] = 1
+    results, errors = evaluate_batch(num_1, np.full(rows, "/", dtype=object), num_2)
+
+    mismatches = 0
+    for a, b, result, error in zip(num_1.tolist(), num_2.tolist(), results, errors):
+        expected = a // b if a % b == 0 else a / b
+        if error or type(result) is not type(expected) or result != expected:
+            mismatches += 1
+            print(f"{a} / {b}: batch gave {result!r}{error}, Python gives {expected!r}")
+    print(f"Checked {rows} batch divisions, {mismatches} mismatches")
+    return mismatches
+
+
+"""
+Parses the name=value bindings given after an --expr expression
+"""
+def parse_bindings(args):
+    bindings = {}
+    for arg in args:
+        name, sep, value = arg.partition("=")
+        if not sep:
+            raise ValueError(f"invalid binding '{arg}', expected name=value")
+        try:
+            bindings[name] = float(value)
+        except ValueError:
+            raise ValueError(f"invalid number '{value}' for {name}")
+        if not math.isfinite(bindings[name]):
+            raise ValueError(f"non-finite number '{value}' for {name}")
+    return bindings
+
+
+"""
+Allow the user to re-use the calculator as often they wish, evaluate a whole
+file of operations with: calculator.py --batch [FILE], evaluate a single
+expression with: calculator.py --expr "a * b + 1" a=2 b=3, time the
+expression cache with: calculator.py --bench-expr, or check batch division
+against Python with: calculator.py --check-batch. Returns the exit status
+"""
+def main(argv):
+    if len(argv) > 1 and argv[1] == "--batch":
+        if len(argv) > 2 and argv[2] != "-":
+            with open(argv[2]) as in_file:
+                batch_calculator(in_file, sys.stdout)
+        else:
+            batch_calculator(sys.stdin, sys.stdout)
+    elif len(argv) > 2 and argv[1] == "--expr":
+        try:
+            print(evaluate_expression(argv[2], parse_bindings(argv[3:])))
+        except ValueError as error:
+            print(f"error: {error}", file=sys.stderr)
+            return 1
+    elif len(argv) > 1 and argv[1] == "--bench-expr":
+        benchmark_expressions()
+    elif len(argv) > 1 and argv[1] == "--check-batch":
+        return 1 if check_batch_division() else 0
+    else:
+        use_calc = True
+        while use_calc:
+            calculator()
+            use_calc = ask_ok("Would you like to perform another operation y\\n? ")
+
+        print("Thank you for using our calculator.")
+
 
-print("Thank you for using our calculator.")
+if __name__ == "__main__":
+    sys.exit(main(enable_from_argv(sys.argv)))
@@ -8,9 +8,18 @@ Assumptions:
     - that the data files columns are in this order:
           Year, Month, Total Rainfall, Most Rainfall, Rain days
 """
+import os
+import sys
 import numpy as np
 from sys import exit
 
+# The county data files are read from the directory of this python program
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the shared profiling module lives in the repository root
+sys.path.append(os.path.dirname(DATA_DIR))
+from profiling import profile_stage, enable_from_argv
+
 # Gobals used for our Singleton pattern for the data
 global_counties_dict = None
 global_counties_data_dict = None
@@ -34,6 +43,7 @@ def get_counties_dict():
     return global_counties_dict
 
 
+@profile_stage("cso_rainfall", "load")
 def load_rainfall_txt_files():
     """
     We only want to load the county Data files once, so as to save on
@@ -45,7 +55,7 @@ def load_rainfall_txt_files():
         # use the global countiesDict to store the numpy data arrays
         global_counties_data_dict = dict()
         for k, v in sorted(get_counties_dict().items()):
-            global_counties_data_dict[v] = np.genfromtxt(v + "Rainfall.txt", dtype=float, delimiter=' ')
+            global_counties_data_dict[v] = np.genfromtxt(os.path.join(DATA_DIR, v + "Rainfall.txt"), dtype=float, delimiter=' ')
 
     return global_counties_data_dict
 
@@ -89,11 +99,20 @@ def basic_stats_by_location(message, dataIndex):
         return
 
     loc = counties_dict[loc_choice]
-    data_dict = load_rainfall_txt_files()
+    max_value, mean_value = basic_stats(loc, dataIndex)
 
     print()
-    print(f"{loc}: Max {message} = {np.amax(data_dict[loc], axis=0)[dataIndex]:.2f}")
-    print(f"{loc}: Average {message} = {np.mean(data_dict[loc], axis=0)[dataIndex]:.2f}")
+    print(f"{loc}: Max {message} = {max_value:.2f}")
+    print(f"{loc}: Average {message} = {mean_value:.2f}")
+
+
+@profile_stage("cso_rainfall", "aggregate")
+def basic_stats(loc, dataIndex):
+    """
+    Return the max and mean of the dataIndex column for the given location
+    """
+    data_dict = load_rainfall_txt_files()
+    return np.amax(data_dict[loc], axis=0)[dataIndex], np.mean(data_dict[loc], axis=0)[dataIndex]
 
 
 def cumulative_stats(start, end):
@@ -138,35 +157,51 @@ def calc_num_rain_days():
     basic_stats_by_location("Number of Rain days", 4)
 
 
-def calc_wettest_loc():
+@profile_stage("cso_rainfall", "aggregate")
+def total_rainfall_by_location():
     """
-    Calculate and display the the cumulative Total Rainfall stats for all locations
+    Return the cumulative Total Rainfall for each location, in county order
+    """
+    return np.sum(cumulative_stats(2, 3), axis=0)
+
+
+def wettest_location(cum_totals=None):
+    """
+    Return the name and cumulative Total Rainfall of the wettest location,
+    from the totals of total_rainfall_by_location(), computed when not given
     """
     counties = sorted(get_counties_dict().items())
+    if cum_totals is None:
+        cum_totals = total_rainfall_by_location()
+    row_index = np.argmax(cum_totals, axis=0)
+    return counties[row_index][1], cum_totals[row_index]
 
+
+def calc_wettest_loc():
+    """
+    Calculate and display the the cumulative Total Rainfall stats for all locations
+    """
     # Calculate cumulative stats for Total rain, and display results
-    cum_array = cumulative_stats(2, 3)
-    cum_totals = np.sum(cum_array, axis=0)
+    cum_totals = total_rainfall_by_location()
     print_cum_stats(cum_totals, "mm")
 
-    # Display the stat for the max county
-    row_index = np.argmax(cum_totals, axis=0)
+    # Display the stat for the max county, from the same totals
+    county, total = wettest_location(cum_totals)
     print()
     print(
-        f"The wettest location in Ireland is {counties[row_index][1]} with a rainfall figure of {cum_totals[row_index]:.2f}mm")
+        f"The wettest location in Ireland is {county} with a rainfall figure of {total:.2f}mm")
 
 
-def calc_prob_rain_days():
+@profile_stage("cso_rainfall", "aggregate")
+def prob_rain_days(days):
     """
-    Calculate and display the the cumulative Probability Rainfall stats for all
-    locations, taking into account the 'days' threshold provided by user
+    Return the percentage of months, for each location in county order, with
+    at most the given number of rain days
     """
     # Retrieve the Number data for all counties
     cum_array = cumulative_stats(4, 5)
 
-    # Retrieve the threshold from the user, and filter the cumulative array for
-    # each county. Filter by the threshold provided by the user
-    days = ask_for_int("Please enter maximum threshold value for number of rain days:")
+    # Filter the cumulative array for each county by the threshold provided
     cum_day_list = list()
     for k, v in sorted(get_counties_dict().items()):
         # index is -1 from the key
@@ -174,6 +209,18 @@ def calc_prob_rain_days():
         bool_array = county_array <= days
         cum_day_list.append((len(county_array[bool_array]) * 100.0 / len(county_array)))
 
+    return cum_day_list
+
+
+def calc_prob_rain_days():
+    """
+    Calculate and display the the cumulative Probability Rainfall stats for all
+    locations, taking into account the 'days' threshold provided by user
+    """
+    # Retrieve the threshold from the user
+    days = ask_for_int("Please enter maximum threshold value for number of rain days:")
+    cum_day_list = prob_rain_days(days)
+
     # Display the probability stats for each county using our cumulative list
     # and % unit of measurement
     print_cum_stats(cum_day_list, "%")
@@ -212,5 +259,7 @@ def main():
             print("No such option.")
 
 
-# call the main method to start the program
-main()
+# call the main method to start the program, only when run as a script
+if __name__ == "__main__":
+    enable_from_argv(sys.argv)
+    main()
@@ -4,13 +4,75 @@
 @author: Jill Daly
 """
 
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.datasets import make_classification
 
 
+# the movie data file is expected alongside this python program
+MOVIE_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'movie_metadata.csv')
+
+# the shared profiling module lives in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(MOVIE_DATA_FILE)))
+from profiling import profile_stage, enable_from_argv
+from rendering import chart_spec, render_charts
+
+# The columns read from the movie data file and the dtype each is stored as.
+# Columns no analysis uses (plot_keywords, color, language, country and
+# content_rating) are never read, movie_imdb_link is only kept as the numeric
+# imdb_id parsed from it, repetitive names are stored as categoricals, and the
+# numeric columns, which all feed the correlation heat map, are downcast after
+# parsing by compact_dtypes()
+MOVIE_SCHEMA = {'director_name': 'category',
+                'num_critic_for_reviews': 'float64',
+                'duration': 'float64',
+                'director_facebook_likes': 'float64',
+                'actor_3_facebook_likes': 'float64',
+                'actor_2_name': 'category',
+                'actor_1_facebook_likes': 'float64',
+                'gross': 'float64',
+                'genres': 'category',
+                'actor_1_name': 'category',
+                'movie_title': 'str',
+                'num_voted_users': 'float64',
+                'cast_total_facebook_likes': 'float64',
+                'actor_3_name': 'category',
+                'facenumber_in_poster': 'float64',
+                'movie_imdb_link': 'str',
+                'num_user_for_reviews': 'float64',
+                'budget': 'float64',
+                'title_year': 'float64',
+                'actor_2_facebook_likes': 'float64',
+                'imdb_score': 'float64',
+                'aspect_ratio': 'float64',
+                'movie_facebook_likes': 'float64'}
+
+ACTOR_COLUMNS = ['actor_1_name', 'actor_2_name', 'actor_3_name']
+
+# Every person credited on a film, used to build the collaboration index
+PERSON_COLUMNS = ['director_name'] + ACTOR_COLUMNS
+
+# The sparse collaboration index built by collaboration_index():
+#   people        - Index of every person, giving the row of each matrix
+#   appearances   - person x movie matrix, 1 where the person is credited
+#   shared_films  - person x person count of films made together
+#   shared_gross  - person x person total gross of films made together
+CollaborationIndex = namedtuple('CollaborationIndex',
+                                ['people', 'appearances', 'shared_films', 'shared_gross'])
+
+# Global holding the DataFrame the background precomputation was started for,
+# and the future of each aggregate being computed
+global_precompute = None
+
+
 def ask_for_int(prompt, retries=100, reminder='Please try again!'):
     """
     Safely Retrieves an int from a user input, allowing the user to correct a 
@@ -77,12 +139,10 @@ def most_successful(df):
 
 
 
-def most_successful_actor(df):
+def stack_actors(df):
     """
-    Groups the DataFrame to find the most successful actors and displays 
-    this information in a bar chart.
-    
-    The user is given the option to choose the number of actors to display
+    Stacks the three actor columns into a single actor_name column, so that
+    each actor is credited with the gross of every film they appear in
     """
     # create a dataframe with just two columns, for simplicity
     df_actor_1 = df[['actor_1_name','gross', 'movie_title']]
@@ -95,32 +155,73 @@ def most_successful_actor(df):
     df_actor_3.columns = df_columns
     
     df_actors = pd.concat([df_actor_1, df_actor_2, df_actor_3], ignore_index=True)
-    df_actors = df_actors.dropna()
+    return df_actors.dropna()
+
+
+
+@profile_stage('meta_vis', 'aggregate')
+def top_actors(df, count):
+    """
+    Returns the count actors with the highest total gross, highest first
+    """
+    # group the data by actor name, creates a Panda Group By Data Frame
+    df_by_actor = stack_actors(df).groupby('actor_name', as_index=False, observed=True)
+    df_by_actor = df_by_actor.agg({'gross': 'sum'})
+
+    df_by_actor = df_by_actor.sort_values(['gross'], ascending=False).head(count)
+
+    # plain names, as seaborn draws a bar for every category of a categorical
+    return df_by_actor.astype({'actor_name': 'str'})
+
+
+
+def most_successful_actor(df):
+    """
+    Groups the DataFrame to find the most successful actors and displays 
+    this information in a bar chart.
     
+    The user is given the option to choose the number of actors to display
+    """
     # When we have the data merged, we need to check the upper limit
-    actor_count = len(df_actors['actor_name'].unique())
+    df_ranking = precomputed(df, 'actor_ranking')
+    actor_count = len(df_ranking)
     
     # Ask the user to input how many actors to display
     actor_count_choice = ask_for_display_count(actor_count, 'actors')
 
-    # group the data by director name, creates a Panda Group By Data Frame
-    df_by_actor = df_actors.groupby('actor_name', as_index=False)
-    df_by_actor = df_by_actor.agg({'gross':np.sum})
-    
-    df_by_actor = df_by_actor.sort_values(['gross'], ascending=False)
-    df_plot = df_by_actor.head(actor_count_choice)
+    df_plot = df_ranking.head(actor_count_choice)
         
     # Print out for the report
     # print(df_plot)
     
     # display the results in a horizontal bar chart
-    ax = sns.barplot(x='gross', y='actor_name', data=df_plot, orient="h", color='blue')
-    ax.set(xlabel='Gross (in Billions)', ylabel='Actor', 
-           title=f'{actor_count_choice} Most Succesful Actors')
-    plt.show()
+    with profile_stage('meta_vis', 'render', 'most_successful_actor'):
+        ax = sns.barplot(x='gross', y='actor_name', data=df_plot, orient="h", color='blue')
+        ax.set(xlabel='Gross (in Billions)', ylabel='Actor', 
+               title=f'{actor_count_choice} Most Succesful Actors')
+        plt.show()
    
     
     
+@profile_stage('meta_vis', 'aggregate')
+def top_directors(df, count):
+    """
+    Returns the count directors with the highest total gross, highest first
+    """
+    # create a dataframe with just two columns, for simplicity
+    df = df[['director_name','gross']]
+
+    # group the data by director name, creates a Panda Group By Data Frame
+    df_by_dir = df.groupby('director_name', as_index=False, observed=True)
+    df_by_dir = df_by_dir.agg({'gross': 'sum'})
+
+    df_by_dir = df_by_dir.sort_values(['gross'], ascending=False).head(count)
+
+    # plain names, as seaborn draws a bar for every category of a categorical
+    return df_by_dir.astype({'director_name': 'str'})
+
+
+
 def most_successful_dir(df):
     """
     Groups the DataFrame to find the most successful directors and displays 
@@ -134,24 +235,27 @@ def most_successful_dir(df):
     # Ask the user to input how many directors to display
     dir_count_choice = ask_for_display_count(dir_count, 'directors')
     
-    # create a dataframe with just two columns, for simplicity
-    df = df[['director_name','gross', 'movie_title']]
-    
-    # group the data by director name, creates a Panda Group By Data Frame
-    df_by_dir = df.groupby('director_name', as_index=False)
-    df_by_dir = df_by_dir.agg({'gross':np.sum})
-    
-    df_by_dir = df_by_dir.sort_values(['gross'], ascending=False)
-    df_plot = df_by_dir.head(dir_count_choice)
+    df_plot = precomputed(df, 'director_ranking').head(dir_count_choice)
     
     # Print out for the report
     # print(df_plot)
     
     # display the results in a horizontal bar chart
-    ax = sns.barplot(x='gross', y='director_name', data=df_plot, orient="h", color='blue')
-    ax.set(xlabel='Gross (in Billions)', ylabel='Director', 
-           title=f'{dir_count_choice} Most Succesful Directors')
-    plt.show()
+    with profile_stage('meta_vis', 'render', 'most_successful_dir'):
+        ax = sns.barplot(x='gross', y='director_name', data=df_plot, orient="h", color='blue')
+        ax.set(xlabel='Gross (in Billions)', ylabel='Director', 
+               title=f'{dir_count_choice} Most Succesful Directors')
+        plt.show()
+
+
+
+@profile_stage('meta_vis', 'aggregate')
+def compare_films(df, title_1, title_2):
+    """
+    Returns the gross, facebook likes and IMDB score rows for the two films
+    """
+    df_comparison = df[((df['movie_title'] == title_1) | (df['movie_title'] == title_2))]
+    return df_comparison[['movie_title', 'gross', 'movie_facebook_likes', 'imdb_score']]
 
 
 
@@ -180,8 +284,7 @@ def film_comparison(df):
             break
         
     # Once the movies are selected, next we get the comparison data
-    df_comparison = df[((df['movie_title'] == movie_choice1 ) | (df['movie_title'] == movie_choice2))]
-    df_comparison = df_comparison[['movie_title', 'gross', 'movie_facebook_likes', 'imdb_score']]
+    df_comparison = compare_films(df, movie_choice1, movie_choice2)
     
     # Offer the User the choices available
     print('\ni.   IMDB Scores')
@@ -208,6 +311,7 @@ def film_comparison(df):
     
     
     
+@profile_stage('meta_vis', 'render')
 def imdb_scores(df):
     """
     Display a bar chart comparing movies IMDB scores
@@ -218,6 +322,7 @@ def imdb_scores(df):
     
     
     
+@profile_stage('meta_vis', 'render')
 def gross_earnings(df):
     """
     Display a bar chart comparing movies gross earnings
@@ -228,6 +333,7 @@ def gross_earnings(df):
 
 
 
+@profile_stage('meta_vis', 'render')
 def movie_fb_like(df):
     """
     Display a bar chart comparing movies facebook likes
@@ -238,6 +344,28 @@ def movie_fb_like(df):
 
 
 
+def year_range(df):
+    """
+    Returns the earliest and latest title years in the DataFrame
+    """
+    return int(df['title_year'].min()), int(df['title_year'].max())
+
+
+
+@profile_stage('meta_vis', 'aggregate')
+def gross_by_year(df, yr_start, yr_end):
+    """
+    Returns the min, max and mean gross earnings for each title year in the
+    inclusive range yr_start to yr_end
+    """
+    df_dist = df[['title_year', 'gross']]
+    df_dist = df_dist[((df_dist.title_year >= yr_start) & (df_dist.title_year <= yr_end))]
+
+    df_by_year = df_dist.groupby('title_year', as_index=False)
+    return df_by_year['gross'].agg(min_gross='min', max_gross='max', avg_gross='mean')
+
+
+
 def dist_gross_earnings(df):
     """
     Allows the user to successfully enter a date range to compare the 
@@ -245,11 +373,8 @@ def dist_gross_earnings(df):
     Displays a line chart for Average, Min and Max values per year
     
     """    
-    df_dist = df[['title_year', 'gross']]
-
     # allow the user to successfully enter two years to analyse    
-    min_yr = int(np.min(df_dist[['title_year']])[0])
-    max_yr = int(np.max(df_dist[['title_year']])[0])
+    min_yr, max_yr = year_range(df)
     print(f'\nThe range of Years to choose from are {min_yr} to {max_yr}')
     yr_start = ask_for_int('Please Enter the start year for distribution analysis: ' )
     yr_end = ask_for_int('Please Enter the end year  for distribution analysis: ')    
@@ -268,43 +393,56 @@ def dist_gross_earnings(df):
             break    
     
     
-    df_dist = df_dist[((df.title_year >= yr_start)  & (df.title_year <= yr_end))]
-    
-    df_by_year = df_dist.groupby('title_year', as_index=False)
-    df_by_year_min_gross = df_by_year.agg({'gross':np.min})
-    df_by_year_min_gross = df_by_year_min_gross.rename(columns={'gross': 'min_gross'})
-    df_by_year_max_gross = df_by_year.agg({'gross':np.max})
-    df_by_year_max_gross = df_by_year_max_gross.rename(columns={'gross': 'max_gross'})
-    df_by_year_mean_gross = df_by_year.agg({'gross':np.mean})
-    df_by_year_mean_gross = df_by_year_mean_gross.rename(columns={'gross': 'avg_gross'})
-    
-    df_merged = pd.merge(df_by_year_min_gross, 
-                         df_by_year_max_gross,
-                         on='title_year',
-                         how='inner')
-    df_merged = pd.merge(df_merged, 
-                         df_by_year_mean_gross,
-                         on='title_year',
-                         how='inner')
+    df_merged = precomputed(df, 'gross_by_year')
+    df_merged = df_merged[((df_merged.title_year >= yr_start) & (df_merged.title_year <= yr_end))]
     
     plot_title = f'Avg, Min, and Max Gross Earnings from {yr_start} to {yr_end}'
     
-    ax = df_merged.plot(x='title_year', y=['min_gross', 'max_gross', 'avg_gross'], kind='line')
-    ax.set(xlabel='Year', ylabel='Movie Gross (in Billions)', 
-           title=plot_title)
-    ax.legend(labels=('Min Gross', 'Max Gross', 'Avg Gross'))
-    plt.show()
+    with profile_stage('meta_vis', 'render', 'dist_gross_earnings'):
+        ax = df_merged.plot(x='title_year', y=['min_gross', 'max_gross', 'avg_gross'], kind='line')
+        ax.set(xlabel='Year', ylabel='Movie Gross (in Billions)', 
+               title=plot_title)
+        ax.legend(labels=('Min Gross', 'Max Gross', 'Avg Gross'))
+        plt.show()
     
     
 
+@profile_stage('meta_vis', 'aggregate')
+def list_genres(df):
+    """
+    Returns the unique genres found in the pipe separated genres column
+    """
+    return df['genres'].str.split('|').explode().unique()
+
+
+
+@profile_stage('meta_vis', 'aggregate')
+def genre_mean_score(df, genre):
+    """
+    Returns the mean IMDB score, to 4 decimal places, for films of the genre
+    """
+    return round(float(np.mean(df[df['genres'].str.contains(genre, regex=False)]['imdb_score'])), 4)
+
+
+
+def genre_scores(df):
+    """
+    Returns every genre alongside the mean IMDB score for films of that genre
+    """
+    genres = list_genres(df)
+    return pd.DataFrame({'genre': genres,
+                         'mean_imdb_score': [genre_mean_score(df, genre) for genre in genres]})
+
+
+
 def genre_analysis(df):
     """
     Allows the user to enter a specific genre from the availble genres, and then
     displays the mean IMDB score for the chosen genre. 
     """
     # parse the dataframe for available genres
-    genre_series = df['genres'].str.split('|').apply(pd.Series).stack().reset_index(drop=True)    
-    genre_unique = genre_series.unique()
+    df_genres = precomputed(df, 'genre_scores')
+    genre_unique = df_genres['genre'].to_numpy()
     
     # Display the options available to the user
     print('\nThe following are the available genres:\n')
@@ -319,11 +457,22 @@ def genre_analysis(df):
             print('No match found for', genre)
     
     # calculate and display the mean IMDB score for the chosen genre
-    mean_imdbscore = round(np.mean(df[df['genres'].str.contains(genre)]['imdb_score']), 4)
+    mean_imdbscore = df_genres.loc[df_genres['genre'] == genre, 'mean_imdb_score'].iloc[0]
     print(f'\nAverage IMDB Score for {genre} films is: {mean_imdbscore}')
         
     
 
+@profile_stage('meta_vis', 'aggregate')
+def numeric_correlations(df):
+    """
+    Returns the correlation matrix of the numeric columns in the DataFrame,
+    leaving out the imdb_id key
+    """
+    return df.drop(columns='imdb_id', errors='ignore').corr(numeric_only=True)
+
+
+
+@profile_stage('meta_vis', 'render')
 def earnings_and_scores(df):
     """
     Visualise the relationship between the label value IMDB Score and the other
@@ -385,7 +534,7 @@ def earnings_and_scores(df):
                                n_redundant=0,
                                random_state=0)
     
-    corrResults = df.corr()
+    corrResults = precomputed(df, 'correlations')
     sns.heatmap(corrResults)
 
     print('Heat Map:')
@@ -393,17 +542,184 @@ def earnings_and_scores(df):
 
 
     
-def clean_data(df):
+def without_diagonal(matrix):
     """
-    """    
-    # Store count of rows from the outset (5043)
-    #pre_de_dup_count = len(df)
+    Removes the diagonal of a square sparse matrix, as nobody collaborates
+    with themselves
+    """
+    matrix = (matrix - sparse.diags(matrix.diagonal(), dtype=matrix.dtype)).tocsr()
+    matrix.eliminate_zeros()
+    return matrix
+
+
+
+@profile_stage('meta_vis', 'aggregate')
+def collaboration_index(df):
+    """
+    Builds the sparse collaboration index for the directors and actors. The
+    person x person matrices are sparse products of the person x movie
+    matrix, so the cost grows with the number of credits rather than
+    quadratically like a self-merge of the DataFrame
+    """
+    people = pd.Index(pd.unique(pd.concat([df[column] for column in PERSON_COLUMNS]).dropna()))
+
+    rows = np.concatenate([people.get_indexer(df[column]) for column in PERSON_COLUMNS])
+    cols = np.tile(np.arange(len(df)), len(PERSON_COLUMNS))
+    credited = rows >= 0
+
+    # a director who also acts is still only one appearance in the film
+    appearances = sparse.csr_matrix((np.ones(credited.sum(), dtype=np.int32),
+                                     (rows[credited], cols[credited])),
+                                    shape=(len(people), len(df)))
+    appearances.data[:] = 1
+
+    gross = np.nan_to_num(df['gross'].to_numpy(dtype=np.float64))
+
+    shared_films = without_diagonal(appearances @ appearances.T)
+    shared_gross = without_diagonal(appearances @ sparse.diags(gross) @ appearances.T)
+
+    return CollaborationIndex(people, appearances, shared_films, shared_gross)
+
+
+
+def person_position(index, name):
+    """
+    Returns the row of the person in the collaboration index matrices
+    """
+    position = index.people.get_indexer([name])[0]
+    if position < 0:
+        raise KeyError(f'{name} is not a director or actor in the data')
+    return position
+
+
+
+def top_collaborators(index, name, count=10, by='films'):
+    """
+    Returns the count people who have worked most with name, ranked by either
+    the number of shared 'films' or the total shared 'gross'
+    """
+    if by not in ('films', 'gross'):
+        raise ValueError(f"by must be 'films' or 'gross', not {by!r}")
+
+    position = person_position(index, name)
+    films_row = index.shared_films.getrow(position)
+    gross_row = index.shared_gross.getrow(position)
+
+    df_collab = pd.DataFrame({'name': index.people[films_row.indices],
+                              'shared_films': films_row.data})
+    df_collab['shared_gross'] = gross_row[:, films_row.indices].toarray()[0]
+
+    sort_column = 'shared_gross' if by == 'gross' else 'shared_films'
+    df_collab = df_collab.sort_values([sort_column, 'name'], ascending=[False, True])
+    return df_collab.head(count).reset_index(drop=True)
+
 
-    # drop duplicates
-    df_new = df.drop_duplicates()
+
+def within_two_hops(index, name):
+    """
+    Returns everyone who has worked with name, at 1 hop, or with one of their
+    collaborators, at 2 hops, as a DataFrame of name and hops
+    """
+    position = person_position(index, name)
+    one_hop = index.shared_films.getrow(position).indices
+    two_hop = np.unique(index.shared_films[one_hop].indices)
+    two_hop = np.setdiff1d(two_hop, np.append(one_hop, position))
+
+    return pd.DataFrame({'name': index.people[np.concatenate([one_hop, two_hop])],
+                         'hops': np.repeat([1, 2], [len(one_hop), len(two_hop)])})
+
+
+
+def collaboration_analysis(df):
+    """
+    Allows the user to enter a director or actor, and displays their top
+    collaborators by shared films or shared gross, and how many people are
+    within 2 hops of them
+    """
+    index = precomputed(df, 'collaborations')
+
+    # Allow the user to successfully choose a person
+    while True:
+        name = input('\nPlease enter a director or actor: ')
+        if name in index.people:
+            break
+        else:
+            print('No match found for', name)
+
+    # Offer the User the choices available
+    print('\ni.  By shared films')
+    print('ii. By shared gross')
+
+    # Allow the user to enter their choice in a user friendly manner
+    while True:
+        choice = input('Please select either i or ii: ')
+
+        if choice == 'i' or choice == 'ii':
+            break
+        else:
+            print('Unable to read', choice)
+
+    collaborator_count = index.shared_films.getrow(person_position(index, name)).nnz
+    if collaborator_count == 0:
+        print(f'\n{name} has no collaborators in the data')
+        return
+
+    count_choice = ask_for_display_count(collaborator_count + 1, 'collaborators')
+    df_collab = top_collaborators(index, name, count_choice,
+                                  by='films' if choice == 'i' else 'gross')
+
+    print(f'\nTop collaborators of {name}:\n')
+    print(df_collab.to_string(index=False))
+
+    df_hops = within_two_hops(index, name)
+    print(f'\n{(df_hops.hops == 1).sum()} people within 1 hop and '
+          f'{(df_hops.hops == 2).sum()} within 2 hops of {name}')
+
+
+
+def imdb_ids(links):
+    """
+    Parse the numeric IMDb id out of each movie_imdb_link, e.g.
+    http://www.imdb.com/title/tt0499549/?ref_=fn_tt_tt_1 gives 499549
+    """
+    return pd.to_numeric(links.str.extract(r'/tt(\d+)', expand=False))
+
+
+
+@profile_stage('meta_vis', 'clean')
+def clean_data(df, report=None):
+    """
+    De-duplicate the movies on their IMDb id, drop rows missing the values the
+    analyses need, and remove any special characters from the movie titles.
+
+    If a report list is given, a dict with the row count and seconds taken
+    after each step is appended to it
+    """
+    steps = report if report is not None else []
+    step_start = time.perf_counter()
+
+    def record(step, df_step):
+        nonlocal step_start
+        step_end = time.perf_counter()
+        steps.append({'step': step, 'rows': len(df_step),
+                      'seconds': round(step_end - step_start, 6)})
+        step_start = step_end
+
+    # Store count of rows from the outset (5043)
+    record('input', df)
+
+    # drop duplicates on the IMDb id, rather than hashing every column, which
+    # also catches the same film scraped twice with different like counts.
+    # Without an id fall back to dropping rows duplicated in every column
+    if 'imdb_id' not in df and 'movie_imdb_link' in df:
+        df = df.assign(imdb_id=imdb_ids(df['movie_imdb_link']))
+    if 'imdb_id' in df:
+        df_new = df[~(df['imdb_id'].duplicated() & df['imdb_id'].notna())]
+    else:
+        df_new = df.drop_duplicates()
     
-    # Store count after de-duplicating (4998)
-    #post_de_dup_count = len(df_new)
+    # Store count after de-duplicating (4919)
+    record('drop_duplicates', df_new)
 
     # drop any missing values from specified columns
     df_new = df_new.dropna(subset = ['director_name', 
@@ -416,25 +732,246 @@ def clean_data(df):
     # reset the index to clear any gaps from dropped rows due to nas
     df_new = df_new.reset_index(drop=True)
 
-    # Store count after dropping na's for specified columns
-    #post_drop_na_count = len(df_new)
+    # Store count after dropping na's for specified columns (4041)
+    record('dropna', df_new)
   
     # remove any speacial characters from the movie titles
-    df_new.movie_title = df_new.movie_title.str.replace('[^\x00-\x7F]','')
-    df_new.movie_title = df_new.movie_title.apply(lambda x: x.strip())
+    df_new['movie_title'] = (df_new['movie_title']
+                             .str.replace('[^\x00-\x7F]', '', regex=True)
+                             .str.strip())
+    record('clean_titles', df_new)
     
     return df_new
 
 
 
+def shared_categoricals(columns):
+    """
+    Encode the string columns as categoricals sharing a single set of
+    categories, in order of first appearance. One factorize of the stacked
+    values is much cheaper than astype('category'), which also sorts them
+    """
+    codes, categories = pd.factorize(np.concatenate([column.to_numpy() for column in columns]))
+    dtype = pd.CategoricalDtype(categories)
+    return [pd.Series(pd.Categorical.from_codes(column_codes, dtype=dtype),
+                      index=column.index, name=column.name)
+            for column, column_codes in zip(columns, np.split(codes, len(columns)))]
+
+
+
+def compact_dtypes(df):
+    """
+    Shrink the DataFrame from the default dtypes. The actor columns share a
+    single set of categories, so stacking them stays categorical. Each numeric
+    column is downcast to the smallest int width holding all of its values,
+    or else to float32 when that keeps them to within pandas' float tolerance
+    """
+    df = df.copy(deep=False)
+
+    actor_columns = [column for column in ACTOR_COLUMNS if column in df]
+    if actor_columns:
+        actors = shared_categoricals([df[column] for column in actor_columns])
+        for column, values in zip(actor_columns, actors):
+            df[column] = values
+
+    for column, dtype in MOVIE_SCHEMA.items():
+        if dtype == 'category' and column in df and column not in actor_columns:
+            df[column] = shared_categoricals([df[column]])[0]
+
+    for column in df.select_dtypes(include='number').columns:
+        values = pd.to_numeric(df[column], downcast='integer')
+        if values.dtype.kind == 'f':
+            values = pd.to_numeric(values, downcast='float')
+        df[column] = values
+
+    return df
+
+
+
+def frame_bytes(df):
+    """
+    The deep memory usage of a DataFrame in bytes. Unlike memory_usage(), the
+    categories shared by several categorical columns are only counted once
+    """
+    total = df.index.memory_usage(deep=True)
+    seen_categories = set()
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            total += values.cat.codes.nbytes
+            if id(values.dtype) not in seen_categories:
+                seen_categories.add(id(values.dtype))
+                total += values.cat.categories.memory_usage(deep=True)
+        else:
+            total += values.memory_usage(deep=True, index=False)
+    return int(total)
+
+
+
+def memory_savings(file=MOVIE_DATA_FILE):
+    """
+    Compare the deep memory usage, in bytes, of the movie data loaded with the
+    default dtypes against the schema driven compact load
+    """
+    default_bytes = frame_bytes(pd.read_csv(file, encoding='ISO-8859-1'))
+    compact_bytes = frame_bytes(read_movies(file))
+    return {'default_bytes': default_bytes,
+            'compact_bytes': compact_bytes,
+            'ratio': round(default_bytes / compact_bytes, 2)}
+
+
+
+@profile_stage('meta_vis', 'load')
+def read_movies(file=MOVIE_DATA_FILE):
+    """
+    Read only the MOVIE_SCHEMA columns of the csv, with compact dtypes
+    """
+    # parsing straight to category is slower than converting afterwards
+    parse_dtypes = {column: 'str' if dtype == 'category' else dtype
+                    for column, dtype in MOVIE_SCHEMA.items()}
+    df = pd.read_csv(file, encoding='ISO-8859-1',
+                     usecols=list(MOVIE_SCHEMA), dtype=parse_dtypes)
+    df['imdb_id'] = imdb_ids(df.pop('movie_imdb_link'))
+    return compact_dtypes(df)
+
+
+
+def load_movies(file=MOVIE_DATA_FILE, report=None):
+    """
+    Read the csv into a pandas dataframe, de-duplicate and reset the index.
+    The report list, if given, collects the clean_data step counts and timings
+    """
+    return clean_data(read_movies(file), report)
+
+
+
+# The continuous features charted against the IMDB score, and their labels
+SCORE_FEATURES = [('gross', 'Gross (in Billions)'),
+                  ('budget', 'Budget (in Billions)'),
+                  ('num_voted_users', 'Number Votes'),
+                  ('director_facebook_likes', 'Director Facebook Likes'),
+                  ('movie_facebook_likes', 'Movie Facebook Likes'),
+                  ('cast_total_facebook_likes', 'Cast Total Facebook Likes'),
+                  ('num_critic_for_reviews', 'Num Critics for Review'),
+                  ('num_user_for_reviews', 'Num Users for Review')]
+
+
+
+def report_charts(df, count=10, films=None):
+    """
+    Returns the chart specs for a full report: the count most successful
+    directors and actors, gross earnings per year, each continuous feature
+    against the IMDB score and the correlation heat map. When films is a pair
+    of titles, their comparison charts are included too
+    """
+    min_yr, max_yr = year_range(df)
+    specs = [
+        chart_spec('top_directors', 'barh', precomputed(df, 'director_ranking').head(count),
+                   f'{count} Most Succesful Directors', 'Gross (in Billions)', 'Director',
+                   x='gross', y='director_name'),
+        chart_spec('top_actors', 'barh', precomputed(df, 'actor_ranking').head(count),
+                   f'{count} Most Succesful Actors', 'Gross (in Billions)', 'Actor',
+                   x='gross', y='actor_name'),
+        chart_spec('gross_by_year', 'line', precomputed(df, 'gross_by_year'),
+                   f'Avg, Min, and Max Gross Earnings from {min_yr} to {max_yr}',
+                   'Year', 'Movie Gross (in Billions)',
+                   x='title_year', y=['min_gross', 'max_gross', 'avg_gross'],
+                   legend=('Min Gross', 'Max Gross', 'Avg Gross')),
+    ]
+
+    for column, label in SCORE_FEATURES:
+        specs.append(chart_spec(f'imdb_score_v_{column}', 'regplot', df[[column, 'imdb_score']],
+                                f'Linear Relationship for {label} v IMDB Scores',
+                                label, 'IMDB Scores', x=column, y='imdb_score'))
+
+    specs.append(chart_spec('correlation_heatmap', 'heatmap', precomputed(df, 'correlations')))
+
+    if films is not None:
+        df_comparison = compare_films(df, *films)
+        for column, label in (('imdb_score', 'IMDB Scores'),
+                              ('gross', 'Gross (in Billions)'),
+                              ('movie_facebook_likes', 'Facebook Likes')):
+            specs.append(chart_spec(f'comparison_{column}', 'barh', df_comparison,
+                                    f'{label} Comparison', label, 'Movie',
+                                    x=column, y='movie_title'))
+    return specs
+
+
+
+def render_report(df, out_dir, count=10, films=None, processes=None):
+    """
+    Render every report_charts() chart to an image file in out_dir, in
+    parallel, returning the files written
+    """
+    return render_charts(report_charts(df, count, films), out_dir, processes)
+
+
+
+# The expensive aggregates computed in the background while the menu is idle,
+# each a function of the cleaned DataFrame
+PRECOMPUTE_TASKS = {
+    'director_ranking': lambda df: top_directors(df, len(df)),
+    'actor_ranking': lambda df: top_actors(df, 3 * len(df)),
+    'gross_by_year': lambda df: gross_by_year(df, *year_range(df)),
+    'genre_scores': genre_scores,
+    'correlations': numeric_correlations,
+    'collaborations': collaboration_index,
+}
+
+
+
+def start_precompute(df):
+    """
+    Start computing each of the PRECOMPUTE_TASKS on a background thread, so
+    they are ready by the time the user has picked a menu option
+    """
+    global global_precompute
+    cancel_precompute()
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='meta_vis_precompute')
+    futures = {name: executor.submit(task, df) for name, task in PRECOMPUTE_TASKS.items()}
+    executor.shutdown(wait=False)
+    global_precompute = (df, futures)
+
+
+
+def cancel_precompute():
+    """
+    Drop any aggregates still waiting to be computed in the background
+    """
+    global global_precompute
+    if global_precompute is not None:
+        for future in global_precompute[1].values():
+            future.cancel()
+    global_precompute = None
+
+
+
+def precomputed(df, name):
+    """
+    Returns the named aggregate for the DataFrame, waiting for the background
+    result if one was started for this DataFrame, and only computing it here
+    otherwise
+    """
+    if global_precompute is not None and global_precompute[0] is df:
+        future = global_precompute[1][name]
+        if not future.cancelled():
+            return future.result()
+
+    return PRECOMPUTE_TASKS[name](df)
+
+
+
 def main():
     """
     Present the main menu to the user, and execute the relevant choice/function
     """
 
     # read the csv into a pandas dataframe, de-duplicate and reset the index
-    df = pd.read_csv('movie_metadata.csv', encoding='ISO-8859-1')
-    df = clean_data(df)
+    df = load_movies()
+
+    # get the expensive aggregates underway while the user reads the menu
+    start_precompute(df)
 
 
     # Create the choice to function mapping in a dict
@@ -444,7 +981,8 @@ def main():
         "3": ("Analyse the distribution of gross earnings", dist_gross_earnings),
         "4": ("Genre Analysis", genre_analysis),
         "5": ("Earnings and IMDB scores", earnings_and_scores),
-        "6": ("Exit", None)
+        "6": ("Collaborations between directors and actors", collaboration_analysis),
+        "7": ("Exit", None)
     }
 
     # this line is hardcoded for dev-testing
@@ -460,7 +998,8 @@ def main():
         if choice in main_menu:
             
             # Before we call our fucntions, check if the user selected Exit
-            if "6" == choice:
+            if "7" == choice:
+                cancel_precompute()
                 print('Exiting the application')
                 break
             
@@ -471,5 +1010,12 @@ def main():
 
 
 
-# call the main method to start the program
-main()
+# call the main method to start the program, only when run as a script
+if __name__ == '__main__':
+    argv = enable_from_argv(sys.argv)
+
+    # meta_vis.py --report DIR renders every chart to DIR without the menu
+    if len(argv) > 2 and argv[1] == '--report':
+        print("\n".join(render_report(load_movies(), argv[2])))
+    else:
+        main()
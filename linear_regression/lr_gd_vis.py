@@ -1,15 +1,28 @@
+import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
 
-def load_data(file):
+# the training data is expected alongside this python program
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.xlsx")
+
+# the shared profiling module lives in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(DATA_FILE)))
+from profiling import profile_stage, enable_from_argv
+from rendering import chart_spec, render_charts
+
+
+@profile_stage("lr_gd_vis", "load")
+def load_data(file=DATA_FILE):
     data_file = pd.ExcelFile(file)
     df = pd.read_excel(data_file, 'train')
     df = df.dropna()
     return df.X.values, df.Y.values
 
 
+@profile_stage("lr_gd_vis", "render")
 def visualise_relationship(x, y, title='Linear Regression - Lab 01'):
     plt.scatter(x,y)
     plt.xlabel('X')
@@ -19,6 +32,12 @@ def visualise_relationship(x, y, title='Linear Regression - Lab 01'):
     return plt
 
 
+@profile_stage("lr_gd_vis", "clean")
+def standardise(X):
+    # moves X to be centred on 0 with unit variance
+    return (X - np.mean(X))/np.std(X)
+
+
 def hypothesis(X, lambda1, bias):
     return (lambda1 * X) + bias
 
@@ -35,7 +54,8 @@ def r_sq(residuals, sum_squares):
     return 1 - (np.sum(residuals**2)/sum_squares)    
 
 
-def linear_regression_gd(X, y, gd_iters, plt):
+@profile_stage("lr_gd_vis", "train")
+def linear_regression_gd(X, y, gd_iters, alpha=0.05):
     
     # Starting values for the slope (lambda1) and constant(bias)
     lambda1 = 0.0
@@ -43,7 +63,6 @@ def linear_regression_gd(X, y, gd_iters, plt):
     
     # As we approach a local miniumu, gradient descent will automatically take
     # smaller steps. This is why there is no need to decrease alpha over time
-    alpha = 0.05  
     
     # starting values for measuring the model
     sum_squares = np.sum((np.mean(y) - y)**2)
@@ -85,33 +104,57 @@ def linear_regression_gd(X, y, gd_iters, plt):
         mse_values.append(mse(errors, m))
         rsq = r_sq(errors, sum_squares)
 
+    
+    # TODO - How can we apply a stopping point for convergence?
+    return lambda1, bias, rsq, mse_values
+
 
+@profile_stage("lr_gd_vis", "render")
+def plot_mse(mse_values):
     # plot improvement in MSE values 
     plt.plot(mse_values)
     plt.show()
-    
-    
-    # TODO - How can we apply a stopping point for convergence?
-    return lambda1, bias, rsq
+
+
+def report_charts(X, y, gd_iters=500):
+    # trains the model and returns the chart specs for the relationship, the
+    # MSE improvement and the final fitted line
+    specs = [chart_spec('relationship', 'scatter', pd.DataFrame({'X': X, 'Y': y}),
+                        'Linear Regression - Lab 01', 'X', 'Y', x='X', y='Y')]
+
+    X = standardise(X)
+    lambda1, bias, rsq, mse_values = linear_regression_gd(X, y, gd_iters)
+    specs.append(chart_spec('mse', 'line', mse_values, 'MSE', 'Iteration', 'MSE'))
+
+    # sorted on X so the fitted line is drawn left to right
+    df_fit = pd.DataFrame({'X': X, 'Y': y, 'fit': hypothesis(X, lambda1, bias)}).sort_values('X')
+    specs.append(chart_spec('fitted_line', 'scatter', df_fit, f'Fitted Line (r sq = {rsq:.4f})',
+                            'X (standardised)', 'Y', x='X', y='Y', fit='fit'))
+    return specs
+
+
+def render_report(out_dir, file=DATA_FILE, processes=None):
+    # renders every report chart to an image file in out_dir, in parallel
+    X, y = load_data(file)
+    return render_charts(report_charts(X, y), out_dir, processes)
 
 
 def main():
     
-    file = "data.xlsx"
-
     # Load the data values
-    X, y = load_data(file)
+    X, y = load_data()
     
     # Examine thge Relationship
     plt = visualise_relationship(X, y)
     
     # Standardise X, which transforms the data, effectively moving X to the 
     # negative part of the axis, and making the scale smaller. 
-    X = (X - np.mean(X))/np.std(X)
+    X = standardise(X)
     
     # Build the linear regression model, applying gradient descent algorithm,
     # to find the local minimum/convergence
-    lambda1, bias, rsq = linear_regression_gd(X, y, 500, plt) 
+    lambda1, bias, rsq, mse_values = linear_regression_gd(X, y, 500)
+    plot_mse(mse_values)
     
     print('lambda1 = ', lambda1)
     print('bias = ', bias)
@@ -121,9 +164,17 @@ def main():
     y_predicted = hypothesis(X, lambda1, bias)
     
     # visualise the final fitted line 
-    plt.scatter(X, y)
-    plt.plot(X,y_predicted,'k-')
-    plt.show()
+    with profile_stage("lr_gd_vis", "render", "main"):
+        plt.scatter(X, y)
+        plt.plot(X,y_predicted,'k-')
+        plt.show()
     
     
-main()    
+if __name__ == '__main__':
+    argv = enable_from_argv(sys.argv)
+
+    # lr_gd_vis.py --report DIR renders the charts to DIR instead of showing them
+    if len(argv) > 2 and argv[1] == '--report':
+        print("\n".join(render_report(argv[2])))
+    else:
+        main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Opt-in instrumentation shared by the analysis scripts.
+
+Each analysis stage (load, clean, aggregate, render...) is wrapped with
+profile_stage(), either as a decorator or a context manager. When profiling is
+disabled this costs a single flag check. When enabled, one JSON line is
+written per stage naming the function (or block) profiled and the thread it ran
+on, with its wall time, the CPU time of its thread and its peak allocations
+(tracemalloc), and optionally a cProfile dump of the stage.
+
+Profiling is enabled by either:
+    - setting the environment variable SCRATCHPAD_PROFILE=1
+    - passing --profile to any of the scripts, which calls enable()
+
+Further environment variables:
+    SCRATCHPAD_PROFILE_FILE  append the JSON lines here instead of stderr
+    SCRATCHPAD_PROFILE_DIR   also dump cProfile stats per stage to this directory
+
+tracemalloc only tracks a single process wide peak, so peak_bytes is the
+process wide peak while the stage was open, less the memory traced when it
+started. Allocations by stages running concurrently on other threads (such as
+the meta_vis background precomputation) are therefore counted in each other's
+peak_bytes, but no stage loses its own peak to another stage resetting it.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ContextDecorator
+from itertools import count
+
+# Module level settings, following the same global pattern as the scripts
+global_profile_enabled = False
+global_profile_file = None
+global_profile_dir = None
+
+# The [start, peak] tracemalloc figures of every open stage, on any thread,
+# guarded by _peak_lock so a reset never discards a peak another stage needs
+_open_stages = {}
+_peak_lock = threading.Lock()
+_dump_counter = count(1)
+_active_profiler = None
+
+
+def enable(output=None, cprofile_dir=None):
+    """
+    Turn on instrumentation. output is a file path to append the JSON lines to
+    (stderr when None), cprofile_dir a directory for per-stage cProfile dumps
+    """
+    global global_profile_enabled, global_profile_file, global_profile_dir
+    global_profile_enabled = True
+    global_profile_file = output
+    global_profile_dir = cprofile_dir
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Turn off instrumentation, stopping tracemalloc
+    """
+    global global_profile_enabled
+    global_profile_enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def enable_from_argv(argv):
+    """
+    Enable profiling when --profile is in the argument list, returning the
+    arguments with the flag removed
+    """
+    if "--profile" not in argv:
+        return argv
+
+    enable(os.environ.get("SCRATCHPAD_PROFILE_FILE"),
+           os.environ.get("SCRATCHPAD_PROFILE_DIR"))
+    return [arg for arg in argv if arg != "--profile"]
+
+
+def fold_peak():
+    """
+    Carry the tracemalloc peak so far into every open stage, so the peak can
+    be reset. Must be called holding _peak_lock
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for figures in _open_stages.values():
+        figures[1] = max(figures[1], peak)
+
+
+def emit(record):
+    """
+    Write a single record as a JSON line to the configured output
+    """
+    line = json.dumps(record) + "\n"
+    if global_profile_file is None:
+        sys.stderr.write(line)
+    else:
+        with open(global_profile_file, "a") as out_file:
+            out_file.write(line)
+
+
+class profile_stage(ContextDecorator):
+    """
+    Records wall time, CPU time and peak allocations for one stage of an
+    analysis. As a decorator the record is named after the function, a with
+    block names itself, e.g.
+
+        @profile_stage("meta_vis", "clean")
+        def clean_data(df):
+            ...
+
+        with profile_stage("meta_vis", "render", "most_successful_dir"):
+            ...
+    """
+
+    def __init__(self, analysis, stage, name=None):
+        self.analysis = analysis
+        self.stage = stage
+        self.name = name
+        self.active = False
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = func.__qualname__
+        return super().__call__(func)
+
+    def _recreate_cm(self):
+        # a fresh instance per call, so decorated functions are re-entrant
+        return profile_stage(self.analysis, self.stage, self.name)
+
+    def __enter__(self):
+        global _active_profiler
+        self.active = global_profile_enabled
+        if not self.active:
+            return self
+
+        with _peak_lock:
+            fold_peak()
+            tracemalloc.reset_peak()
+            _open_stages[self] = [tracemalloc.get_traced_memory()[0], 0]
+
+        # cProfile can not nest, so only the outermost stage is profiled, and
+        # only on the main thread as a profiler only sees its own thread
+        self.profiler = None
+        if global_profile_dir and _active_profiler is None \
+                and threading.current_thread() is threading.main_thread():
+            self.profiler = _active_profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        global _active_profiler
+        if not self.active:
+            return False
+
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.thread_time() - self.cpu_start
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            _active_profiler = None
+            os.makedirs(global_profile_dir, exist_ok=True)
+            self.profiler.dump_stats(os.path.join(
+                global_profile_dir,
+                f"{self.analysis}-{self.stage}-{next(_dump_counter)}.prof"))
+
+        with _peak_lock:
+            fold_peak()
+            start, peak = _open_stages.pop(self)
+
+        emit({"analysis": self.analysis,
+              "stage": self.stage,
+              "name": self.name,
+              "thread": threading.current_thread().name,
+              "wall_s": round(wall, 6),
+              "cpu_s": round(cpu, 6),
+              "peak_bytes": max(peak - start, 0),
+              "time": time.time()})
+        return False
+
+
+if os.environ.get("SCRATCHPAD_PROFILE", "") not in ("", "0"):
+    enable(os.environ.get("SCRATCHPAD_PROFILE_FILE"),
+           os.environ.get("SCRATCHPAD_PROFILE_DIR"))
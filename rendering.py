@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Off-screen chart rendering shared by the analysis scripts.
+
+A chart is described by a plain dict specification (see chart_spec()), so
+that a whole report of charts can be handed to a pool of worker processes and
+drawn in parallel on the non-interactive Agg backend, instead of one by one on
+the main thread behind plt.show().
+
+Each worker is sent its share of the charts in one batch, and re-uses a single
+template Figure per figure size for all of them rather than building a new
+figure, canvas and renderer for every chart.
+
+Workers are spawned rather than forked, as forking a process with other
+threads running (such as the meta_vis background precomputation) can leave
+the children deadlocked on a lock held by one of those threads.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+from matplotlib.figure import Figure
+import seaborn as sns
+
+from profiling import profile_stage
+
+# Figure templates re-used by this process for every chart it draws, keyed by
+# the figure size
+_templates = {}
+
+
+def chart_spec(name, kind, data, title='', xlabel='', ylabel='', **options):
+    """
+    Describe a chart to render. kind is one of the DRAWERS below, data is a
+    DataFrame (or sequence of values for a 'line' without an x column) and
+    options holds the kind specific settings such as x, y and legend
+    """
+    spec = {'name': name, 'kind': kind, 'data': data,
+            'title': title, 'xlabel': xlabel, 'ylabel': ylabel}
+    spec.update(options)
+    return spec
+
+
+def draw_barh(ax, spec):
+    sns.barplot(x=spec['x'], y=spec['y'], data=spec['data'], orient='h', color='blue', ax=ax)
+
+
+def draw_line(ax, spec):
+    if spec.get('x') is None:
+        ax.plot(spec['data'])
+        return
+
+    spec['data'].plot(x=spec['x'], y=spec['y'], kind='line', ax=ax)
+    if spec.get('legend'):
+        ax.legend(labels=spec['legend'])
+
+
+def draw_scatter(ax, spec):
+    data = spec['data']
+    ax.scatter(data[spec['x']], data[spec['y']])
+    if spec.get('fit'):
+        ax.plot(data[spec['x']], data[spec['fit']], 'k-')
+
+
+def draw_regplot(ax, spec):
+    sns.regplot(x=spec['x'], y=spec['y'], data=spec['data'], ax=ax)
+
+
+def draw_heatmap(ax, spec):
+    sns.heatmap(spec['data'], ax=ax)
+
+
+# The chart kinds that can be rendered, and the function that draws each one
+DRAWERS = {'barh': draw_barh,
+           'line': draw_line,
+           'scatter': draw_scatter,
+           'regplot': draw_regplot,
+           'heatmap': draw_heatmap}
+
+
+def render_chart(spec):
+    """
+    Draw a single chart onto this process's template figure for its size and
+    save it to spec['file']
+    """
+    size = tuple(spec.get('figsize', (6.4, 4.8)))
+    fig = _templates.get(size)
+    if fig is None:
+        fig = _templates[size] = Figure(figsize=size)
+
+    fig.clf()
+    ax = fig.add_subplot()
+    DRAWERS[spec['kind']](ax, spec)
+    ax.set(title=spec['title'], xlabel=spec['xlabel'], ylabel=spec['ylabel'])
+    fig.savefig(spec['file'], dpi=spec.get('dpi', 100), bbox_inches='tight')
+    return spec['file']
+
+
+def render_batch(specs):
+    """
+    Render a batch of charts in this process, returning the files written
+    """
+    return [render_chart(spec) for spec in specs]
+
+
+def init_worker():
+    """
+    Worker processes never display anything, so always use the Agg backend
+    """
+    matplotlib.use('Agg')
+
+
+@profile_stage('rendering', 'render')
+def render_charts(specs, out_dir, processes=None, image_format='png'):
+    """
+    Render every chart spec to out_dir/<name>.<image_format>, spread over a
+    pool of processes (one per CPU by default, or run in this process when
+    processes is 1). Returns the files written, in the order of specs
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    specs = [dict(spec, file=os.path.join(out_dir, f"{spec['name']}.{image_format}"))
+             for spec in specs]
+
+    processes = min(processes or os.cpu_count() or 1, len(specs))
+    if processes <= 1:
+        return render_batch(specs)
+
+    # deal the charts out round robin, one batch per worker process
+    batches = [specs[i::processes] for i in range(processes)]
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker) as executor:
+        rendered = list(executor.map(render_batch, batches))
+
+    files = [None] * len(specs)
+    for i, batch_files in enumerate(rendered):
+        files[i::processes] = batch_files
+    return files